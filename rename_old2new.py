@@ -3,10 +3,11 @@ import re
 import sys
 import logging
 import argparse
+import threading
 from pathlib import Path
-from typing import Dict, Union
+from typing import Dict, Optional, Set, Union
 from concurrent.futures import ThreadPoolExecutor
-from words_replacer import WordsReplacer, read_config_file
+from words_replacer import WordsReplacer, read_config_file, scan_tree
 
 # Global replacement rules for euv to xuv conversion
 REPLACEMENT_RULES = {
@@ -15,6 +16,15 @@ REPLACEMENT_RULES = {
     'Cat': 'Dog'
 }
 
+# Single alternation over all rule keys, longest first so that
+# 'Hello world' wins over 'Hello' at the same position
+_ALT_RE = re.compile('|'.join(
+    re.escape(key) for key in sorted(REPLACEMENT_RULES, key=len, reverse=True)
+)) if REPLACEMENT_RULES else None
+
+def _replace_match(match: re.Match) -> str:
+    return REPLACEMENT_RULES[match.group(0)]
+
 def apply_replacement_rules(text: str) -> str:
     """
     Apply all replacement rules to the given text
@@ -25,10 +35,9 @@ def apply_replacement_rules(text: str) -> str:
     Returns:
         The text with all replacements applied
     """
-    result = text
-    for old, new in REPLACEMENT_RULES.items():
-        result = result.replace(old, new)
-    return result
+    if _ALT_RE is None:
+        return text
+    return _ALT_RE.sub(_replace_match, text)
 
 # Configure logging
 logging.basicConfig(
@@ -46,6 +55,13 @@ def get_current_script_basename():
     script_basename = os.path.basename(script_path)
     return script_basename
 
+# Files that are never renamed, built once at import
+SKIP_FILES = frozenset({
+    get_current_script_basename(),
+    'launch.json',
+    'Doxyfile'
+})
+
 def get_project_root():
     current_dir = os.path.dirname(get_current_script_abspath())
     while True:
@@ -68,55 +84,41 @@ def get_rename_filepaths(code_path: Union[str, Path]):
     Returns:
         Dictionary containing old file paths and new file paths {old_path: new_path}
     """
-    SKIP_FILES = {
-        get_current_script_basename(),
-        'launch.json',
-        'Doxyfile'
-    } 
-
     rename_files_dict = {}
     rename_dirs_dict = {}
-    code_path = Path(code_path)
-    
-    def should_process(file_path: Path) -> bool:
-        """Determine if the file should be processed"""
-        return (
-            '.git' not in file_path.parts
-            and file_path.name not in SKIP_FILES
-        )
-
-    # Traverse all files
-    for file_path in code_path.rglob('*'):
-        if not should_process(file_path):
+    
+    # Traverse all files, .git is pruned by the walk itself
+    for entry in scan_tree(code_path):
+        if entry.name in SKIP_FILES:
+            continue
+        stem, suffix = os.path.splitext(entry.name)
+        # Most names contain no rule key, skip the replacement for them
+        if not any(key in stem for key in REPLACEMENT_RULES):
             continue
         
-        new_base = abbreviate_words(file_path.stem)
-        new_name = new_base + file_path.suffix
+        new_base = abbreviate_words(stem)
+        new_name = new_base + suffix
         
         
-        if new_name != file_path.name:
-            old_path = str(file_path)
-            new_path = str(file_path.with_name(new_name))
-            if  file_path.is_file():
+        if new_name != entry.name:
+            old_path = entry.path
+            new_path = os.path.join(os.path.dirname(entry.path), new_name)
+            if entry.is_file():
                 rename_files_dict[old_path] = new_path
             else:
                 rename_dirs_dict[old_path] = new_path
             logger.info(f'Will rename to: {new_name}')
             
-    rename_files_dict = dict(sorted(rename_files_dict.items(), key=lambda item: (-len(str(item[1])), item[1])))
+    # Deepest directories first so children are renamed before their parents
     rename_dirs_dict = dict(sorted(rename_dirs_dict.items(), key=lambda item: (-len(str(item[1])), item[1])))
     return rename_files_dict,rename_dirs_dict
 
 def abbreviate_words(base): 
-    result = base
-    for key, value in REPLACEMENT_RULES.items():
-        if key in result:
-            result = re.sub(key, value, result)    
-    return result
+    return apply_replacement_rules(base)
 
 def rename_context(code_path,rename_files_dict, rename_dirs_dict):
     
-    max_workers = 20     # Use 20 worker threads
+    max_workers = None   # Default to the CPU count, capped on Windows
     buffer_size = 16384  # 16KB buffer size
     
     file_words_dict = {}
@@ -140,44 +142,93 @@ def rename_context(code_path,rename_files_dict, rename_dirs_dict):
     # Add the base replacement rules
     dir_words_dict.update(REPLACEMENT_RULES)
 
+    # Reuse the text files found by the first pass instead of walking the tree again
     dirReplacer = WordsReplacer(
         code_path=code_path,
         words_dict=dir_words_dict,
         max_workers=max_workers, 
-        buffer_size=buffer_size
+        buffer_size=buffer_size,
+        preclassified_files=fileReplacer.last_text_files
     )
     dirReplacer.run()
 
-def rename_single(old_path: str, new_path: str) -> bool:
+def list_dir_names(dir_path: str) -> Set[str]:
+    """Return the names of all entries in a directory, or an empty set if it cannot be listed"""
+    try:
+        with os.scandir(dir_path) as it:
+            return {entry.name for entry in it}
+    except OSError:
+        return set()
+
+# Guards the prefetched listings shared by the rename threads
+_dir_names_lock = threading.Lock()
+
+def path_exists(path: str, dir_names: Optional[Dict[str, Set[str]]] = None) -> bool:
+    """Check a path against prefetched directory listings, falling back to os.path.exists"""
+    if dir_names is None:
+        return os.path.exists(path)
+    parent, name = os.path.split(path)
+    with _dir_names_lock:
+        if parent in dir_names:
+            return name in dir_names[parent]
+    return os.path.exists(path)
+
+def update_dir_names(old_path: str, new_path: str, dir_names: Optional[Dict[str, Set[str]]] = None) -> None:
+    """Record a completed rename in the prefetched directory listings"""
+    if dir_names is None:
+        return
+    old_parent, old_name = os.path.split(old_path)
+    new_parent, new_name = os.path.split(new_path)
+    with _dir_names_lock:
+        if old_parent in dir_names:
+            dir_names[old_parent].discard(old_name)
+        if new_parent in dir_names:
+            dir_names[new_parent].add(new_name)
+
+def rename_single(old_path: str, new_path: str, dir_names: Optional[Dict[str, Set[str]]] = None,
+                  seen_dirs: Optional[Set[str]] = None) -> bool:
     """Rename a single file
     
     Args:
         old_path: Original file path
         new_path: New file path
+        dir_names: Optional prefetched listings {dir_path: entry_names} used
+            instead of per-file existence checks
+        seen_dirs: Optional set of target directories already created,
+            shared across a batch to avoid repeated makedirs calls
         
     Returns:
         bool: True if rename succeeded, False otherwise
     """
     try:
-        if not os.path.exists(old_path):
+        if not path_exists(old_path, dir_names):
             logger.error(f"Source file not found: {old_path}")
             return False
             
-        # Ensure target directory exists
-        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        # Ensure target directory exists, unless the file stays in its own directory
+        new_dir = os.path.dirname(new_path)
+        if new_dir != os.path.dirname(old_path) and (seen_dirs is None or new_dir not in seen_dirs):
+            os.makedirs(new_dir, exist_ok=True)
+            if seen_dirs is not None:
+                seen_dirs.add(new_dir)
         
         # Remove target file if exists
-        if os.path.exists(new_path):
+        if path_exists(new_path, dir_names):
             os.remove(new_path)
             
         os.rename(old_path, new_path)
+        # Keep the listings current for later renames in the same batch
+        update_dir_names(old_path, new_path, dir_names)
         logger.info(f"Successfully renamed: {old_path} -> {new_path}")
         return True
     except Exception as e:
         logger.error(f"Failed to rename {old_path}: {str(e)}")
         return False
                 
-def batch_rename_filename(code_path: str, rename_files: Dict[str, str], max_workers: int = 4) -> None:
+# Renames block in the kernel with the GIL released, so use more threads than CPUs
+RENAME_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def batch_rename_filename(code_path: str, rename_files: Dict[str, str], max_workers: int = RENAME_MAX_WORKERS) -> None:
     """Multi-threaded batch file renaming
     
     Args:
@@ -195,9 +246,17 @@ def batch_rename_filename(code_path: str, rename_files: Dict[str, str], max_work
         for old, new in rename_files.items()
     }
     
+    # List each affected directory once instead of checking every path
+    dir_names = {}
+    for path in (*rename_map.keys(), *rename_map.values()):
+        parent = os.path.dirname(path)
+        if parent not in dir_names:
+            dir_names[parent] = list_dir_names(parent)
+    
+    seen_dirs = set()
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         results = list(executor.map(
-            lambda x: rename_single(x[0], x[1]), 
+            lambda x: rename_single(x[0], x[1], dir_names, seen_dirs), 
             rename_map.items()
         ))
     
@@ -2,12 +2,16 @@ import os
 import re
 import sys
 import logging
+import mmap
+import codecs
+import shutil
+import tempfile
 import argparse
-import subprocess
-from io import StringIO
+import itertools
 from pathlib import Path
-from typing import Dict, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 # Configure logging
 logging.basicConfig(
@@ -17,122 +21,280 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Directories that are never walked into
+SKIP_DIRS = frozenset({'.git'})
+
+def scan_tree(root: str, skip_dirs: frozenset = SKIP_DIRS) -> Iterator[os.DirEntry]:
+    """
+    Recursively yield the entries (files and directories) under root
+
+    Uses os.scandir so the entry type comes from the directory listing
+    instead of a stat per path. Directories named in skip_dirs are
+    neither yielded nor descended into; symlinked directories are not
+    followed.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except PermissionError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name in skip_dirs:
+                continue
+            yield entry
+            yield from scan_tree(entry.path, skip_dirs)
+        else:
+            yield entry
+
+# Number of leading bytes inspected to classify a file
+SNIFF_SIZE = 4096
+
+# Files larger than this are scanned through mmap before being read
+MMAP_THRESHOLD = 1 << 20
+
+def _sniff_encoding(head: bytes) -> str:
+    """Guess the encoding of a file from its leading bytes"""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    # Explicit byte order keeps the BOM as U+FEFF and writes it back unchanged
+    if head.startswith(codecs.BOM_UTF16_LE):
+        return 'utf-16-le'
+    if head.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16-be'
+    # NUL bytes do not occur in 8-bit or UTF-8 text
+    if b'\x00' in head:
+        return 'binary'
+    try:
+        # The head may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        # Other 8-bit text (GBK, Latin-1, ...): latin-1 maps every byte to
+        # itself, so ASCII words are still replaced without corrupting the rest
+        return 'latin-1'
+
+def _is_ascii_compatible(encoding: str) -> bool:
+    """Check whether ASCII text is stored byte-for-byte in this encoding"""
+    try:
+        return 'ascii'.encode(encoding) == b'ascii'
+    except LookupError:
+        return False
+
 class WordsReplacer:
-    def __init__(self, code_path: str, words_dict: dict, max_workers: int = None, buffer_size: int = 8192):
+    def __init__(self, code_path: str, words_dict: dict, max_workers: int = None, buffer_size: int = 8192,
+                 preclassified_files: Optional[Dict[str, str]] = None):
         """
         Initialize the word replacer
         :param code_path: Source code directory path
         :param words_dict: Replacement dictionary {old_word: new_word}
-        :param max_workers: Number of CPU worker threads
+        :param max_workers: Number of worker processes, defaults to the CPU count.
+                            Only the first run sizes the shared pool
         :param buffer_size: Read buffer size
+        :param preclassified_files: Text files and their encodings {file_path: encoding},
+                                    e.g. last_text_files of an earlier run over the
+                                    same tree; skips the directory walk and detection
         """
         self.code_path = Path(code_path)
         self.words_dict = words_dict
         self.max_workers = max_workers
         self.buffer_size = buffer_size
+        self.preclassified_files = preclassified_files
+        # Text files seen by the last run {file_path: encoding}
+        self.last_text_files: Optional[Dict[str, str]] = None
+        # Compile all words into one alternation so each file is scanned once.
+        # Longest words come first so the regex prefers 'Hello world' over 'Hello'
+        ordered = sorted(words_dict, key=len, reverse=True)
+        self._lookup = words_dict
+        self._keys = tuple(ordered)
+        self._pat = re.compile('|'.join(map(re.escape, ordered))) if words_dict else None
+        # Pure ASCII words can be replaced on raw bytes without decoding
+        self._pat_bytes = None
+        self._lookup_bytes = None
+        self._keys_bytes = ()
+        if words_dict and all(k.isascii() and v.isascii() for k, v in words_dict.items()):
+            self._lookup_bytes = {k.encode(): v.encode() for k, v in words_dict.items()}
+            self._keys_bytes = tuple(k.encode() for k in ordered)
+            self._pat_bytes = re.compile(b'|'.join(re.escape(k.encode()) for k in ordered))
+
+    def _replace_match(self, match: re.Match) -> str:
+        return self._lookup[match.group(0)]
+
+    def _replace_match_bytes(self, match: re.Match) -> bytes:
+        return self._lookup_bytes[match.group(0)]
+
+    def _classify_and_process(self, file_path: str, encoding: Optional[str] = None) -> Optional[str]:
+        """Detect the encoding of a single file and replace words in it
+
+        The file is opened once: the leading bytes decide whether it is
+        text, and the rest is read from the same handle. Large files are
+        scanned through mmap and only read if they contain a word.
+        Detection is skipped when the encoding is already known.
 
-    def _get_file_encoding(self, file_path: str) -> Tuple[str, str]:
-        """Get file encoding"""
+        Returns the file encoding, or None if the file was skipped
+        """
         try:
-            # Check if we're on Windows
-            if os.name == 'nt':
-                # On Windows, we'll try to open the file as text
-                # and use utf-8 as default encoding
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        # Try to read a small portion to test encoding
-                        f.read(100)
-                    return file_path, 'utf-8'
-                except UnicodeDecodeError:
-                    # If utf-8 fails, try with utf-8-sig (for files with BOM)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8-sig') as f:
-                            f.read(100)
-                        return file_path, 'utf-8-sig'
-                    except UnicodeDecodeError:
-                        # If both fail, it might be a binary file
-                        return file_path, 'binary'
-            else:
-                # On Unix/Linux, use the file command as before
-                output = subprocess.check_output(
-                    ['file', '-i', file_path], 
-                    stderr=subprocess.STDOUT
-                ).decode().strip()
-                
-                if match := re.search(r'charset=([^\s,]+)', output):
-                    encoding = match.group(1)
-                elif 'application/octet-stream' in output:
-                    encoding = 'binary'
-                else:
-                    encoding = None
-                    
-                return file_path, encoding
+            with open(file_path, 'rb', buffering=self.buffer_size) as f:
+                head = f.read(SNIFF_SIZE)
+                if encoding is None:
+                    encoding = _sniff_encoding(head)
+                if encoding == 'binary':
+                    logger.debug(f"Skipped binary file: {file_path}")
+                    return None
+                if (self._pat_bytes is not None and _is_ascii_compatible(encoding)
+                        and os.fstat(f.fileno()).st_size > MMAP_THRESHOLD):
+                    # Let the kernel page large files in for the scan and
+                    # only copy them into memory when a word is found
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        if not self._pat_bytes.search(mm):
+                            return encoding
+                data = head + f.read()
         except Exception as e:
-            logger.error(f"Failed to get file encoding {file_path}: {str(e)}")
-            # Fall back to utf-8 for text files
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    f.read(100)
-                return file_path, 'utf-8'
-            except:
-                return file_path, None
-
-    def _collect_text_files(self) -> Dict[str, str]:
-        """Collect all non-binary text files and their encodings"""
-        all_files = {}
-        file_paths = [str(f) for f in self.code_path.rglob('*') if f.is_file()]
-        
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            results = executor.map(self._get_file_encoding, file_paths)
-            
-            for file_path, encoding in results:
-                if encoding not in ('binary', None):
-                    all_files[file_path] = encoding
-        
-        return all_files
+            logger.error(f"Failed to read file {file_path}: {str(e)}")
+            return None
+
+        self._process_file(file_path, data, encoding)
+        return encoding
 
-    def _process_file(self, file_info: Tuple[str, str]):
+    def _process_file(self, file_path: str, data: bytes, encoding: str):
         """Process replacement operations for a single file"""
-        file_path, encoding = file_info
         try:
-            # Use StringIO as buffer
-            output_buffer = StringIO()
-            content_changed = False
-
-            # Read file content using buffer
-            with open(file_path, 'r', encoding=encoding, buffering=self.buffer_size) as f:
-                while chunk := f.read(self.buffer_size):
-                    # Replace words in current chunk
-                    new_chunk = chunk
-                    for old_word, new_word in self.words_dict.items():
-                        if old_word in new_chunk:
-                            new_chunk = new_chunk.replace(old_word, new_word)
-                            content_changed = True
-                    
-                    # Write to buffer
-                    output_buffer.write(new_chunk)
+            if self._pat_bytes is not None and _is_ascii_compatible(encoding):
+                # ASCII words map to the same bytes in the file, skip the codec.
+                # Most files contain none of the words, a plain substring
+                # search rejects them faster than the regex
+                if not any(k in data for k in self._keys_bytes):
+                    return
+                new_data, count = self._pat_bytes.subn(self._replace_match_bytes, data)
+            else:
+                text = data.decode(encoding)
+                if not any(k in text for k in self._keys):
+                    return
+                new_text, count = self._pat.subn(self._replace_match, text)
+                new_data = new_text.encode(encoding)
 
             # Only write to file if content has changed
-            if content_changed:
-                with open(file_path, 'w', encoding=encoding, buffering=self.buffer_size) as f:
-                    output_buffer.seek(0)
-                    # Write all content at once
-                    f.write(output_buffer.getvalue())
+            if count:
+                self._write_atomic(file_path, new_data)
                 logger.info(f"Processed file: {file_path}")
                 
-            # Clean up buffer
-            output_buffer.close()
-                
         except Exception as e:
             logger.error(f"Failed to process file {file_path}: {str(e)}")
 
+    def _write_atomic(self, file_path: str, data: bytes):
+        """Write data next to the file and swap it in, so a crash never leaves it truncated"""
+        # A unique name never clobbers an existing file next to this one
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(file_path) + '.', suffix='.qcr.tmp',
+            dir=os.path.dirname(file_path)
+        )
+        try:
+            with os.fdopen(fd, 'wb', buffering=self.buffer_size) as f:
+                f.write(data)
+            # Keep the permission bits, the mtime should reflect the edit
+            shutil.copymode(file_path, tmp_path)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     def run(self):
         """Execute replacement operations"""
-        text_files = self._collect_text_files()
-        logger.info(f"Found {len(text_files)} text files to process")
+        if self._pat is None:
+            logger.info("No words to replace")
+            return
+
+        if self.preclassified_files is not None:
+            files = list(self.preclassified_files.items())
+        else:
+            # Symlinks are skipped, os.replace would swap the link for a regular file
+            files = [
+                (entry.path, None) for entry in scan_tree(self.code_path)
+                if entry.is_file(follow_symlinks=False)
+            ]
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            executor.map(self._process_file, text_files.items())
+        # Replacement is CPU-bound, use processes so the GIL does not serialize it.
+        # The pool is shared by every run, each batch carries this run's words
+        executor, workers = _get_executor(self.max_workers)
+        run_key = next(_run_counter)
+        batch_size = max(1, -(-len(files) // (workers * BATCHES_PER_WORKER)))
+        text_files = {}
+        try:
+            futures = {}
+            for i in range(0, len(files), batch_size):
+                batch = files[i:i + batch_size]
+                future = executor.submit(_process_batch, run_key, self.words_dict, self.buffer_size, batch)
+                futures[future] = batch
+
+            for future in as_completed(futures):
+                for (file_path, _), encoding in zip(futures[future], future.result()):
+                    if encoding is not None:
+                        text_files[file_path] = encoding
+        except BrokenProcessPool as e:
+            # Drop the broken pool so later runs start a fresh one
+            logger.error(f"Worker process failed, some files were not processed: {str(e)}")
+            _reset_executor()
+            self.last_text_files = None
+            return
+        self.last_text_files = text_files
+        logger.info(f"Processed {len(text_files)} text files")
+
+# Number of path batches each worker process receives per run
+BATCHES_PER_WORKER = 4
+
+# Process pool shared by all runs and its worker count, created on first use
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_run_counter = itertools.count()
+
+# Replacer of the current run, cached in each worker process
+_worker_replacer: Optional[Tuple[int, WordsReplacer]] = None
+
+# ProcessPoolExecutor rejects more workers than this on Windows
+WINDOWS_MAX_WORKERS = 61
+
+def _resolve_workers(max_workers: Optional[int] = None) -> int:
+    """Worker count for the pool: the CPU count by default, capped on Windows"""
+    workers = max_workers or os.cpu_count() or 1
+    if os.name == 'nt':
+        workers = min(workers, WINDOWS_MAX_WORKERS)
+    return workers
+
+def _get_executor(max_workers: Optional[int] = None) -> Tuple[ProcessPoolExecutor, int]:
+    """
+    Return the shared process pool and its worker count
+
+    max_workers only applies when the pool is first created, a later
+    request for a different size is logged and the existing pool reused.
+    """
+    global _executor, _executor_workers
+    workers = _resolve_workers(max_workers)
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    elif max_workers is not None and workers != _executor_workers:
+        logger.warning(f"Ignoring max_workers={max_workers}, reusing the shared pool "
+                       f"of {_executor_workers} worker processes")
+    return _executor, _executor_workers
+
+def _reset_executor():
+    """Discard the shared process pool, e.g. after a worker crashed"""
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = None
+    _executor_workers = 0
+
+def _process_batch(run_key: int, words_dict: dict, buffer_size: int,
+                   files: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+    """Classify and process a batch of files inside a worker process"""
+    global _worker_replacer
+    if _worker_replacer is None or _worker_replacer[0] != run_key:
+        # Compile the words once per run in this worker
+        _worker_replacer = (run_key, WordsReplacer('.', words_dict, buffer_size=buffer_size))
+    replacer = _worker_replacer[1]
+    return [replacer._classify_and_process(file_path, encoding) for file_path, encoding in files]
 
 def get_current_script_abspath():
     return os.path.abspath(__file__)
@@ -141,18 +303,15 @@ def get_current_script_abspath():
 def read_config_file(cfg_file_path):
     config_dict = {}
     try:
-        with open(cfg_file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                # Remove leading and trailing whitespace from the line
-                line = line.strip()
-                # Skip empty lines and comment lines
-                if not line or line.startswith('#'):
-                    continue
-                # Split the line by the first space
-                parts = line.split(' ', 1)
-                if len(parts) == 2:
-                    key, value = parts
-                    config_dict[key] = value[0].upper() + value[1:]
+        text = Path(cfg_file_path).read_text(encoding='utf-8')
+        # Skip empty and comment lines, split the rest by the first space
+        config_dict = {
+            key: value[0].upper() + value[1:]
+            for line in map(str.strip, text.splitlines())
+            if line and not line.startswith('#')
+            for key, _, value in [line.partition(' ')]
+            if value
+        }
     except FileNotFoundError:
         logger.error(f"Error: File {cfg_file_path} not found.")
     except Exception as e:
@@ -186,7 +345,7 @@ if __name__ == "__main__":
     if args.config_file and os.path.isfile(args.config_file):
         words_dict = words_dict = read_config_file(args.config_file)
 
-    max_workers = 20     # Use 20 worker threads
+    max_workers = None   # Default to the CPU count, capped on Windows
     buffer_size = 16384  # 16KB buffer size
     replacer = WordsReplacer(
         code_path=code_path,